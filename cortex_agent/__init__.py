@@ -0,0 +1,13 @@
+from cortex_agent.core import (
+    agent_run,
+    init_session_state,
+    render_message,
+    stream_events,
+)
+
+__all__ = [
+    "agent_run",
+    "init_session_state",
+    "render_message",
+    "stream_events",
+]
@@ -0,0 +1,404 @@
+import functools
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+
+import httpx
+import numpy as np
+import orjson
+import pandas as pd
+import streamlit as st
+from models import (
+    ChartEventData,
+    DataAgentRunRequest,
+    ErrorEventData,
+    Message,
+    ResultSet,
+    RowType,
+    StatusEventData,
+    ThinkingDeltaEventData,
+    ToolResultEventData,
+    ToolUseEventData,
+)
+
+# ------------------------------
+# Environment variables
+# ------------------------------
+PAT = os.getenv("CORTEX_AGENT_DEMO_PAT")
+HOST = os.getenv("CORTEX_AGENT_DEMO_HOST")
+DATABASE = os.getenv("CORTEX_AGENT_DEMO_DATABASE", "SNOWFLAKE_INTELLIGENCE")
+SCHEMA = os.getenv("CORTEX_AGENT_DEMO_SCHEMA", "AGENTS")
+AGENT = os.getenv("CORTEX_AGENT_DEMO_AGENT", "SALES_INTELLIGENCE_AGENT")
+
+_AGENT_URL = (
+    f"https://{HOST}/api/v2/databases/{DATABASE}/schemas/{SCHEMA}/agents/{AGENT}:run"
+    if HOST
+    else None
+)
+_AGENT_HEADERS = {
+    "Authorization": f"Bearer {PAT}",
+    "Content-Type": "application/json",
+}
+
+# ------------------------------
+# Session state
+# ------------------------------
+def init_session_state():
+    if "messages" not in st.session_state:
+        st.session_state.messages = []
+
+    if "render_cache" not in st.session_state:
+        st.session_state.render_cache = {}
+
+# ------------------------------
+# Agent call
+# ------------------------------
+@st.cache_resource
+def _agent_client() -> httpx.Client:
+    # One HTTP/2 connection to Snowflake, kept alive across turns and reruns
+    return httpx.Client(http2=True, verify=True, timeout=httpx.Timeout(None, connect=5.0))
+
+def agent_run(prompt_messages) -> httpx.Response:
+    request_body = DataAgentRunRequest(
+        model="claude-4-sonnet",
+        messages=prompt_messages,
+    )
+    if _AGENT_URL is None or PAT is None:
+        raise Exception("CORTEX_AGENT_DEMO_HOST and CORTEX_AGENT_DEMO_PAT must be set")
+    client = _agent_client()
+    request = client.build_request(
+        "POST",
+        _AGENT_URL,
+        content=orjson.dumps(request_body.to_dict()),
+        headers=_AGENT_HEADERS,
+    )
+    resp = client.send(request, stream=True)
+    if resp.status_code < 400:
+        return resp
+    else:
+        resp.read()
+        resp.close()
+        raise Exception(f"Failed request with status {resp.status_code}: {resp.text}")
+
+# ------------------------------
+# Server-sent events parsing
+# ------------------------------
+SSE_MAX_BUFFER = 32 * 1024 * 1024
+
+def parse_sse(chunks):
+    # Yields (event_name, data_bytes) for each complete event block. Blocks are
+    # split on a blank line, scanning only the bytes appended since the last read.
+    buf = bytearray()
+    carry = b""
+    for chunk in chunks:
+        # Normalize CRLF, holding back a trailing CR until the next chunk arrives
+        chunk = carry + chunk
+        carry = b""
+        if chunk.endswith(b"\r"):
+            chunk, carry = chunk[:-1], b"\r"
+        search = max(len(buf) - 1, 0)
+        buf += chunk.replace(b"\r\n", b"\n")
+
+        start = 0
+        while (end := buf.find(b"\n\n", search)) != -1:
+            event = _parse_sse_block(buf[start:end])
+            if event is not None:
+                yield event
+            start = search = end + 2
+        if start:
+            del buf[:start]
+
+        if len(buf) > SSE_MAX_BUFFER:
+            raise Exception(f"SSE event exceeds {SSE_MAX_BUFFER} bytes")
+
+def _parse_sse_block(block: bytearray):
+    event_name = "message"
+    data = []
+    for line in block.split(b"\n"):
+        field, _, value = line.partition(b":")
+        if value.startswith(b" "):
+            value = value[1:]
+        if field == b"event":
+            event_name = value.decode()
+        elif field == b"data":
+            data.append(value)
+    if not data:
+        return None
+    return event_name, b"\n".join(data)
+
+# ------------------------------
+# Result set and chart conversion
+# ------------------------------
+# Largest NUMBER precision that always fits in an int64
+INT64_MAX_PRECISION = 18
+
+def _column_array(values: tuple, col: RowType):
+    # Values arrive as strings. Integers and floats are parsed into typed arrays
+    # where that is lossless; anything else (wide or scaled NUMBERs, unparsable
+    # values) keeps the strings as sent.
+    match col.type.lower():
+        case "fixed" if col.scale == 0 and col.precision <= INT64_MAX_PRECISION:
+            try:
+                return np.fromiter(map(int, values), dtype=np.int64, count=len(values))
+            except (OverflowError, TypeError, ValueError):
+                pass
+        case "real":
+            try:
+                return np.fromiter(map(float, values), dtype=np.float64, count=len(values))
+            except (TypeError, ValueError):
+                pass
+        case "text":
+            return pd.array(values, dtype="string")
+    return np.array(values, dtype=object)
+
+def rows_frame(rows: list, row_type: list[RowType]) -> pd.DataFrame:
+    # Transpose the row-major payload once, then build each column in one pass
+    columns = list(zip(*rows)) or [()] * len(row_type)
+    # Key the arrays by position so duplicate column names (e.g. a.ID, b.ID)
+    # are all kept, then apply the real names
+    frame = pd.DataFrame(
+        dict(enumerate(_column_array(values, col) for col, values in zip(row_type, columns))),
+        copy=False,
+    )
+    frame.columns = [col.name for col in row_type]
+    return frame
+
+def result_set_frame(result_set: ResultSet) -> pd.DataFrame:
+    return rows_frame(result_set.data, result_set.result_set_meta_data.row_type)
+
+@functools.lru_cache(maxsize=256)
+def _parse_chart_spec(spec: str) -> dict:
+    return orjson.loads(spec)
+
+def chart_spec(spec) -> dict:
+    return spec if isinstance(spec, dict) else _parse_chart_spec(spec)
+
+# ------------------------------
+# Stream response events
+# ------------------------------
+# Text and thinking deltas arrive once per token, so they skip pydantic
+# validation and only keep the two fields the stream needs.
+@dataclass(slots=True, frozen=True)
+class DeltaEventData:
+    content_index: int
+    text: str
+
+    @classmethod
+    def from_dict(cls, obj: dict):
+        return cls(obj["content_index"], obj["text"])
+
+# Table events can carry MB-scale row data. Rather than validating every cell
+# through TableEventData, only the column metadata is built as models and the
+# decoded rows go straight into the DataFrame. The other TableEventData fields
+# (tool_use_id, query_id, title) are not needed to render and are not checked;
+# the closing "response" event still validates the full table via Message.
+@dataclass(slots=True, frozen=True)
+class TableFrameEventData:
+    content_index: int
+    frame: pd.DataFrame
+
+    @classmethod
+    def from_dict(cls, obj: dict):
+        result_set = obj.get("result_set")
+        if result_set is None:
+            return cls(obj["content_index"], pd.DataFrame())
+        row_type = [
+            RowType.from_dict(col)
+            for col in result_set["resultSetMetaData"]["rowType"]
+        ]
+        return cls(obj["content_index"], rows_frame(result_set["data"], row_type))
+
+FLUSH_INTERVAL = 0.05
+FLUSH_CHARS = 512
+
+class StreamContext:
+    def __init__(self):
+        self.content = st.container()
+        self.content_map = defaultdict(self.content.empty)
+        self.buffers = defaultdict(list)
+        self.buffered_len = defaultdict(int)
+        self.writers = {}
+        self.last_flush = defaultdict(float)
+        self.last_written = defaultdict(int)
+        self.dirty = set()
+        self.spinner = st.spinner("Waiting for response...")
+        self.spinner.__enter__()
+
+    def append_delta(self, index: int, text: str):
+        # Buffer the delta and only re-render the element once enough time has
+        # passed or enough text has accumulated since the last write.
+        self.buffers[index].append(text)
+        self.buffered_len[index] += len(text)
+        self.dirty.add(index)
+        if (
+            time.monotonic() - self.last_flush[index] > FLUSH_INTERVAL
+            or self.buffered_len[index] - self.last_written[index] > FLUSH_CHARS
+        ):
+            self.flush(index)
+
+    def flush(self, index: int):
+        self.dirty.discard(index)
+        if self.buffered_len[index] == self.last_written[index]:
+            return
+        # Collapse the pieces so the next flush only joins the new deltas
+        text = "".join(self.buffers[index])
+        self.buffers[index] = [text]
+        self.writers[index](text)
+        self.last_flush[index] = time.monotonic()
+        self.last_written[index] = self.buffered_len[index]
+
+    def flush_all(self):
+        for index in list(self.dirty):
+            self.flush(index)
+
+    def placeholder(self, index: int):
+        # Full content events replace the element, so drop any pending delta write
+        self.dirty.discard(index)
+        self.writers.pop(index, None)
+        return self.content_map[index]
+
+    def set_status(self, message: str):
+        self.flush_all()
+        self.spinner.__exit__(None, None, None)
+        self.spinner = st.spinner(message)
+        self.spinner.__enter__()
+
+    def close(self):
+        self.flush_all()
+        self.spinner.__exit__(None, None, None)
+
+def _handle_status(data: StatusEventData, ctx: StreamContext):
+    ctx.set_status(data.message)
+
+def _handle_text_delta(data: DeltaEventData, ctx: StreamContext):
+    if data.content_index not in ctx.writers:
+        ctx.writers[data.content_index] = ctx.content_map[data.content_index].write
+    ctx.append_delta(data.content_index, data.text)
+
+def _handle_thinking_delta(data: DeltaEventData, ctx: StreamContext):
+    if data.content_index not in ctx.writers:
+        # Build the expander once; later flushes only replace the text inside it
+        expander = ctx.content_map[data.content_index].expander("Thinking", expanded=True)
+        ctx.writers[data.content_index] = expander.empty().write
+    ctx.append_delta(data.content_index, data.text)
+
+def _handle_thinking(data: ThinkingDeltaEventData, ctx: StreamContext):
+    ctx.placeholder(data.content_index).expander("Thinking").write(data.text)
+
+def _handle_tool_use(data: ToolUseEventData, ctx: StreamContext):
+    ctx.placeholder(data.content_index).expander("Tool use").json(data)
+
+def _handle_tool_result(data: ToolResultEventData, ctx: StreamContext):
+    ctx.placeholder(data.content_index).expander("Tool result").json(data)
+
+def _handle_chart(data: ChartEventData, ctx: StreamContext):
+    spec = chart_spec(data.chart_spec)
+    ctx.placeholder(data.content_index).vega_lite_chart(spec, use_container_width=True)
+
+def _handle_table(data: TableFrameEventData, ctx: StreamContext):
+    ctx.placeholder(data.content_index).dataframe(data.frame)
+
+def _handle_error(data: ErrorEventData, ctx: StreamContext):
+    st.error(f"Error: {data.message} (code: {data.code})")
+    st.session_state.messages.pop()
+    return True
+
+def _handle_response(data: Message, ctx: StreamContext):
+    st.session_state.messages.append(data)
+
+# Event name -> (parser, handler). Parsers receive the payload already decoded
+# with orjson; a handler returning True ends the stream.
+_EVENT_TABLE = {
+    "response.status": (StatusEventData.from_dict, _handle_status),
+    "response.text.delta": (DeltaEventData.from_dict, _handle_text_delta),
+    "response.thinking.delta": (DeltaEventData.from_dict, _handle_thinking_delta),
+    "response.thinking": (ThinkingDeltaEventData.from_dict, _handle_thinking),
+    "response.tool_use": (ToolUseEventData.from_dict, _handle_tool_use),
+    "response.tool_result": (ToolResultEventData.from_dict, _handle_tool_result),
+    "response.chart": (ChartEventData.from_dict, _handle_chart),
+    "response.table": (TableFrameEventData.from_dict, _handle_table),
+    "error": (ErrorEventData.from_dict, _handle_error),
+    "response": (Message.from_dict, _handle_response),
+}
+
+def _read_events(response: httpx.Response, events: queue.SimpleQueue, stop: threading.Event):
+    # Runs on a daemon thread: network reads and SSE framing only, no Streamlit
+    # calls. None marks the end of the stream; a raised exception is forwarded.
+    # The thread owns the response (httpx responses are not thread-safe), so it
+    # closes it itself once the stream ends or the script thread sets stop.
+    try:
+        # No chunk_size: httpx would otherwise hold bytes back until a full chunk
+        # had arrived, delaying every event until the stream ends
+        for event in parse_sse(response.iter_bytes()):
+            if stop.is_set():
+                break
+            events.put(event)
+        events.put(None)
+    except Exception as e:
+        events.put(e)
+    finally:
+        response.close()
+
+def stream_events(response: httpx.Response):
+    ctx = StreamContext()
+    events = queue.SimpleQueue()
+    stop = threading.Event()
+    threading.Thread(
+        target=_read_events, args=(response, events, stop), daemon=True
+    ).start()
+    try:
+        while True:
+            try:
+                event = events.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                # Network is idle; render whatever deltas are still buffered
+                ctx.flush_all()
+                continue
+            if event is None:
+                break
+            if isinstance(event, Exception):
+                raise event
+            event_name, event_data = event
+            entry = _EVENT_TABLE.get(event_name)
+            if entry is None:
+                continue
+            parser, handler = entry
+            if handler(parser(orjson.loads(event_data)), ctx):
+                break
+    finally:
+        stop.set()
+        ctx.close()
+
+# ------------------------------
+# Render previous messages
+# ------------------------------
+def _cached_artifact(item, build):
+    # History items are immutable once stored, so the parsed chart spec or built
+    # DataFrame is kept per item and reused on every rerun. The stored item is
+    # compared by identity to guard against id() reuse after a message is dropped.
+    key = id(item)
+    cached = st.session_state.render_cache.get(key)
+    if cached is None or cached[0] is not item:
+        cached = (item, build(item))
+        st.session_state.render_cache[key] = cached
+    return cached[1]
+
+def render_message(msg: Message):
+    with st.chat_message(msg.role):
+        for content_item in msg.content:
+            item = content_item.actual_instance
+            match item.type:
+                case "text":
+                    st.markdown(item.text)
+                case "chart":
+                    spec = _cached_artifact(item, lambda i: chart_spec(i.chart.chart_spec))
+                    st.vega_lite_chart(spec, use_container_width=True)
+                case "table":
+                    st.dataframe(
+                        _cached_artifact(item, lambda i: result_set_frame(i.table.result_set))
+                    )
+                case _:
+                    st.expander(item.type).json(_cached_artifact(item, lambda i: i.to_json()))